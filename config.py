@@ -1,5 +1,4 @@
 import platform
-from Bio.Seq import Seq
 import os
 from hyperopt import hp
 
@@ -19,6 +18,9 @@ SEQUENCE_OUTPUT_WO_PRIMERS = "without_primers"
 DEBUG = "debug"
 DATA_SET_FILE = "data_after_indices_two_files.txt"
 LEARNING = "learning_info"
+# The found sequences are buffered and written to the output files every OUTPUT_FLUSH_COUNT sequences
+OUTPUT_FILE_BUFFER_SIZE = 1 << 20
+OUTPUT_FLUSH_COUNT = 4096
 
 DIRECTORIES = {
     "input_dir": os.path.join(DIR_START, READS),
@@ -32,11 +34,21 @@ DIRECTORIES = {
 # Alignment Parameters
 INDEX_LEN = 12
 LIB_LENGTH = 140
+DATA_SET_MIN_KMER_LEN = 4  # Shorter k-mers are too common for prefiltering the dataset indices
+# Parasail only works with integer scores, so the scores are scaled and rounded. The scale is picked per eval, as
+# large as the score range of the parasail kernel allows within these bounds
+MIN_SCORE_QUANTIZATION_SCALE = 100
+MAX_SCORE_QUANTIZATION_SCALE = 1000
+# The sequences of the files are split into chunks of this many sequences, which are processed by the worker processes
+SEQUENCE_CHUNK_SIZE = 10000
 
 # Primers
-FRONT_PRIMER = Seq("TCGTCGGCAGCGTCAGATGTGTATAAGAGACAG")
-BACK_PRIMER = Seq("CTGTCTCTTATACACATCTCCGAGCCCACGAGAC")
+FRONT_PRIMER = "TCGTCGGCAGCGTCAGATGTGTATAAGAGACAG"
+BACK_PRIMER = "CTGTCTCTTATACACATCTCCGAGCCCACGAGAC"
 PRIMERS = {"front": FRONT_PRIMER, "back": BACK_PRIMER}
+FRONT_PRIMER_BYTES = FRONT_PRIMER.encode()
+BACK_PRIMER_BYTES = BACK_PRIMER.encode()
+PRIMERS_BYTES = {"front": FRONT_PRIMER_BYTES, "back": BACK_PRIMER_BYTES}
 
 # Default Scores
 DEFAULT_SCORES = {
@@ -50,6 +62,8 @@ DEFAULT_SCORES = {
 # Machine Learning Settings
 MACHINE_LEARNING_MODE = True
 EVAL_NUM = 50
+PLOT_EVERY_EVAL = False  # When False, the eval pie charts are only plotted for the best eval
+SVG_PIE_CHARTS = True  # When False, the eval pie charts are plotted with matplotlib as PNG files
 DATA_SET_PATH = os.path.join(DIR_START, DATA_SET_FILE)
 
 DEFAULT_SEARCH_SPACE = {
@@ -0,0 +1,94 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled FASTQ parser, following the same record layout as helper_functions.parse_FASTQ_file.
+Build it in place with: cythonize -i fastq_parse.pyx
+"""
+from libc.math cimport NAN
+from libc.string cimport memchr
+import numpy as np
+
+
+cdef inline bint is_space(unsigned char c):
+    return c == 32 or 9 <= c <= 13
+
+
+def parse(const unsigned char[::1] data):
+    """
+    Parses the records of a FASTQ file content. In a valid record the quality line is as long as the sequence line, so
+    its end is checked at that offset first and only scanned for when it is not there.
+
+    :param data: Buffer of the FASTQ file content (e.g. a mmap of the file).
+    :return: Tuple (seq, ascii_scores) of the list of the non-empty sequences, and a float32 array of the ASCII average
+             scores of their quality lines.
+    """
+    cdef Py_ssize_t n = data.shape[0]
+    cdef Py_ssize_t line_start, line_end, start, end, i
+    cdef Py_ssize_t seq_line_len = 0
+    cdef Py_ssize_t line_index = 0
+    cdef Py_ssize_t score_num = 0
+    cdef bint empty_seq = False
+    cdef bint quality_end_found
+    cdef unsigned long long total
+    cdef const unsigned char* buf
+    cdef const unsigned char* found
+    cdef float[::1] scores_view
+
+    seq = []
+    if n == 0:
+        return seq, np.empty(0, dtype=np.float32)
+    buf = &data[0]
+
+    # Every sequence line takes at least 4 lines of the file, so this is enough room for all the scores
+    ascii_scores = np.empty(n // 4 + 1, dtype=np.float32)
+    scores_view = ascii_scores
+
+    # Filter out the header line (the first line)
+    found = <const unsigned char*>memchr(buf, b'\n', n)
+    line_start = n if found == NULL else found - buf + 1
+    while 0 < line_start < n:
+        quality_end_found = False
+        if line_index % 4 == 2 and not empty_seq:
+            # Sum the quality line up to its expected end, making sure it does not end sooner
+            line_end = line_start + seq_line_len
+            if line_end == n or (line_end < n and buf[line_end] == b'\n'):
+                quality_end_found = True
+                total = 0
+                for i in range(line_start, line_end):
+                    if buf[i] == b'\n':
+                        quality_end_found = False
+                        break
+                    total += buf[i]
+
+        if not quality_end_found:
+            found = <const unsigned char*>memchr(buf + line_start, b'\n', n - line_start)
+            line_end = n if found == NULL else found - buf
+
+        start, end = line_start, line_end
+        if line_index % 4 == 0:
+            while start < end and is_space(buf[start]):
+                start += 1
+            while end > start and is_space(buf[end - 1]):
+                end -= 1
+            seq_line_len = line_end - line_start
+            empty_seq = start == end
+            if not empty_seq:
+                seq.append(buf[start:end].decode('utf-8'))
+        elif line_index % 4 == 2 and not empty_seq:
+            if not quality_end_found:
+                total = 0
+                for i in range(line_start, line_end):
+                    total += buf[i]
+            # Leave the surrounding whitespace out of the average
+            while start < end and is_space(buf[start]):
+                total -= buf[start]
+                start += 1
+            while end > start and is_space(buf[end - 1]):
+                total -= buf[end - 1]
+                end -= 1
+            scores_view[score_num] = <double>total / (end - start) - 33.0 if end > start else NAN
+            score_num += 1
+
+        line_start = line_end + 1
+        line_index += 1
+
+    return seq, ascii_scores[:score_num]
@@ -1,43 +1,139 @@
+import mmap
+import os
+import shutil
+from functools import lru_cache
 from Bio.Align import PairwiseAligner
-from config import DATA_SET_PATH
+import numpy as np
+import parasail
+from config import (DATA_SET_PATH, MIN_SCORE_QUANTIZATION_SCALE, MAX_SCORE_QUANTIZATION_SCALE, OUTPUT_FILE_BUFFER_SIZE,
+                    OUTPUT_FLUSH_COUNT)
+
+# The compiled FASTQ parser is optional, see read_FASTQ_fast
+try:
+    import fastq_parse
+except ImportError:
+    fastq_parse = None
+
+# DNA complement rules
+_COMPLEMENT = str.maketrans('ACGTacgt', 'TGCAtgca')
+_COMPLEMENT_BYTES = bytes.maketrans(b'ACGTacgt', b'TGCAtgca')
+
+# Quality lines shorter than this are summed in Python rather than with numpy
+QUALITY_SUM_ARRAY_MIN_LEN = 320
+
+# Parsed FASTQ files, keyed by path. Each entry holds the modification time of the file when it was parsed
+_fastq_cache = {}
 
 
 def read_FASTQ_file(fastq_file):
+    """
+    Reads a FASTQ file, reusing the parsed result as long as the file was not modified since.
+
+    :param fastq_file: Path to the FASTQ file.
+    :return: Tuple (sequences, scores), as returned by parse_FASTQ_file.
+    """
+    mtime = os.path.getmtime(fastq_file)
+    cached = _fastq_cache.get(fastq_file)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, read_FASTQ_fast(fastq_file))
+        _fastq_cache[fastq_file] = cached
+    return cached[1]
+
+
+def parse_FASTQ_file(fastq_file):
     """
      Reads a FASTQ file and extracts sequences and their corresponding ASCII scores.
 
      :param fastq_file: Path to the FASTQ file.
-     :return: A dictionary with sequences as keys and ASCII average scores as values,
-              and the length of the sequence dictionary.
+     :return: Tuple (sequences, scores) of the list of distinct sequences, in order of first occurrence, and a float32
+              array of their ASCII average scores.
      """
-    seq_data = []
     seq, ascii_scores = [], []
 
-    # Read the FASTQ file and filter out header lines (the first line) and separators
-    with open(fastq_file, 'r') as FASTQ:
-        lines = FASTQ.readlines()[1:]
-        for i, line in enumerate(lines):
-            if i % 2 == 0:
-                seq_data.append(line.strip())
-
-    # Parse the sequences and ASCII scores
-    empty_seq = False
-    for i, data in enumerate(seq_data):
-        if i % 2 == 0:
-            if len(data) == 0:
-                empty_seq = True
-                continue
-            seq.append(data)
-        else:
-            if empty_seq:
-                empty_seq = False
-                continue
-            scores = [ord(char) - 33 for char in data]
-            ascii_scores.append(sum(scores) / len(scores))
+    with open(fastq_file, 'rb') as FASTQ:
+        if os.fstat(FASTQ.fileno()).st_size == 0:
+            return [], np.empty(0, dtype=np.float32)
+
+        with mmap.mmap(FASTQ.fileno(), 0, access=mmap.ACCESS_READ) as FASTQ_map:
+            file_size = len(FASTQ_map)
+
+            # Filter out the header line (the first line), then every record is a sequence line, a separator,
+            # a quality line and the header of the next record
+            line_start = FASTQ_map.find(b'\n') + 1
+            line_index = 0
+            empty_seq = False
+            while 0 < line_start < file_size:
+                line_end = FASTQ_map.find(b'\n', line_start)
+                if line_end == -1:
+                    line_end = file_size
+
+                if line_index % 4 == 0:
+                    data = FASTQ_map[line_start:line_end].strip()
+                    empty_seq = len(data) == 0
+                    if not empty_seq:
+                        seq.append(data.decode())
+                elif line_index % 4 == 2 and not empty_seq:
+                    data = FASTQ_map[line_start:line_end].strip()
+                    ascii_scores.append(quality_line_average(data))
+
+                line_start = line_end + 1
+                line_index += 1
+
+    return deduplicate_reads(seq, ascii_scores)
+
+
+def quality_line_average(data):
+    """
+    Calculates the ASCII average score of a quality line. The sum is taken over integers, so it is exact.
+
+    :param data: The quality line, as bytes.
+    :return: The average of the quality scores, NaN for an empty line.
+    """
+    if len(data) == 0:
+        return float('nan')
+    # Summing a short line in Python is faster than making an array of it
+    if len(data) < QUALITY_SUM_ARRAY_MIN_LEN:
+        total = sum(data)
+    else:
+        total = int(np.frombuffer(data, dtype=np.uint8).sum(dtype=np.uint32))
+    return total / len(data) - 33.0
+
+
+def read_FASTQ_fast(fastq_file):
+    """
+    Reads a FASTQ file with the compiled parser of fastq_parse.pyx, falling back to parse_FASTQ_file when the
+    extension is not built.
+
+    :param fastq_file: Path to the FASTQ file.
+    :return: Tuple (sequences, scores), as returned by parse_FASTQ_file.
+    """
+    if fastq_parse is None:
+        return parse_FASTQ_file(fastq_file)
+
+    with open(fastq_file, 'rb') as FASTQ:
+        if os.fstat(FASTQ.fileno()).st_size == 0:
+            return [], np.empty(0, dtype=np.float32)
 
-    # Create a dictionary mapping sequence to score
-    seq_dict = {s: score for s, score in zip(seq, ascii_scores)}
-    return seq_dict, len(seq_dict)
+        with mmap.mmap(FASTQ.fileno(), 0, access=mmap.ACCESS_READ) as FASTQ_map:
+            seq, ascii_scores = fastq_parse.parse(FASTQ_map)
+
+    return deduplicate_reads(seq, ascii_scores)
+
+
+def deduplicate_reads(seq, ascii_scores):
+    """
+    Deduplicates the reads of a FASTQ file.
+
+    :param seq: List of the sequences, in the order they were read.
+    :param ascii_scores: The ASCII average scores of the sequences.
+    :return: Tuple (sequences, scores), as returned by parse_FASTQ_file.
+    """
+    # A repeated sequence keeps the score of its last occurrence
+    seq_scores = dict(zip(seq, ascii_scores))
+
+    sequences = list(seq_scores)
+    scores = np.fromiter(seq_scores.values(), dtype=np.float32, count=len(sequences))
+    return sequences, scores
 
 
 def copy_reverse_complement(sequence):
@@ -47,10 +143,106 @@ def copy_reverse_complement(sequence):
     :param sequence: DNA sequence (e.g., 'ATCG')
     :return: The reverse complement of the input DNA sequence.
     """
-    sequence = sequence.rstrip()  # Remove any trailing whitespace
-    complement_map = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}  # DNA complement rules
-    complement_sequence = ''.join([complement_map[base] for base in sequence])  # Replace bases with complements
-    return complement_sequence[::-1]  # Reverse the complemented sequence to get the final result
+    # Remove any trailing whitespace, replace bases with complements and reverse the result
+    return sequence.rstrip().translate(_COMPLEMENT)[::-1]
+
+
+def copy_reverse_complement_bytes(sequence):
+    """
+    Generates the reverse complement of a given DNA sequence, given as bytes.
+
+    :param sequence: DNA sequence as bytes (e.g., b'ATCG')
+    :return: The reverse complement of the input DNA sequence, as bytes.
+    """
+    return sequence.rstrip().translate(_COMPLEMENT_BYTES)[::-1]
+
+
+def copy_reverse_complement_with_primers(seq_with_primers, front_primer_len, back_primer_len):
+    """
+    Generates the reverse complement of a sequence with its primers, and takes the reverse complement of the sequence
+    without the primers out of it instead of generating it separately.
+
+    :param seq_with_primers: DNA sequence with the primers.
+    :param front_primer_len: Length of the front primer at the start of the sequence, 0 if it has none.
+    :param back_primer_len: Length of the back primer at the end of the sequence, 0 if it has none.
+    :return: Tuple of the reverse complements of the sequence without the primers and of the sequence with them.
+    """
+    seq_with_primers_rc = copy_reverse_complement(seq_with_primers)
+    # The reverse complement starts with the back primer and ends with the front primer
+    return seq_with_primers_rc[back_primer_len:len(seq_with_primers_rc) - front_primer_len], seq_with_primers_rc
+
+
+def open_output_files(output_wo_primers_file_path, output_with_primers_file_path):
+    """
+    Opens the output files of the sequences without and with primers. The sequences are collected in buffers and
+    written to the files in batches, see write_output_sequences.
+
+    :param output_wo_primers_file_path: Path of the output file of the sequences without primers.
+    :param output_with_primers_file_path: Path of the output file of the sequences with primers.
+    :return: Dictionary of the output files, their buffers and the number of buffered sequences.
+    """
+    return {
+        "wo_primers": open(output_wo_primers_file_path, "wb", buffering=OUTPUT_FILE_BUFFER_SIZE),
+        "with_primers": open(output_with_primers_file_path, "wb", buffering=OUTPUT_FILE_BUFFER_SIZE),
+        "wo_primers_buffer": bytearray(),
+        "with_primers_buffer": bytearray(),
+        "buffered_count": 0,
+    }
+
+
+def write_output_sequences(output_files, seq_without_primers, seq_with_primers):
+    """
+    Adds a found sequence to the output buffers, writing the buffers to the output files every OUTPUT_FLUSH_COUNT
+    sequences.
+
+    :param output_files: Dictionary of the output files, as returned by open_output_files.
+    :param seq_without_primers: The sequence without the primers.
+    :param seq_with_primers: The sequence with the primers.
+    """
+    output_files['wo_primers_buffer'] += f"{seq_without_primers}\n".encode()
+    output_files['with_primers_buffer'] += f"{seq_with_primers}\n".encode()
+    output_files['buffered_count'] += 1
+    if output_files['buffered_count'] >= OUTPUT_FLUSH_COUNT:
+        flush_output_files(output_files)
+
+
+def flush_output_files(output_files):
+    """
+    Writes the buffered sequences to the output files.
+
+    :param output_files: Dictionary of the output files, as returned by open_output_files.
+    """
+    for name in ('wo_primers', 'with_primers'):
+        output_files[name].write(output_files[f"{name}_buffer"])
+        output_files[f"{name}_buffer"].clear()
+    output_files['buffered_count'] = 0
+
+
+def close_output_files(output_files):
+    """
+    Writes the remaining buffered sequences and closes the output files.
+
+    :param output_files: Dictionary of the output files, as returned by open_output_files.
+    """
+    flush_output_files(output_files)
+    output_files['wo_primers'].close()
+    output_files['with_primers'].close()
+
+
+def concatenate_files(part_file_paths, output_file_path):
+    """
+    Concatenates the given files, in order, into the output file and removes them. Missing files are skipped.
+
+    :param part_file_paths: List of the paths of the files to concatenate.
+    :param output_file_path: Path of the output file.
+    """
+    with open(output_file_path, "wb") as output_file:
+        for part_file_path in part_file_paths:
+            if not os.path.exists(part_file_path):
+                continue
+            with open(part_file_path, "rb") as part_file:
+                shutil.copyfileobj(part_file, output_file, OUTPUT_FILE_BUFFER_SIZE)
+            os.remove(part_file_path)
 
 
 def get_alignment_positions(alignment):
@@ -80,17 +272,20 @@ def is_overlap(start, end, regions):
     return False
 
 
-def percentage_to_min_score(aligner, wanted_match_percentage, length):
+@lru_cache(maxsize=256)
+def scores_to_min_score(scores, wanted_match_percentage, length):
     """
-    Calculates the minimum valid alignment score based on a desired match percentage.
+    Calculates the minimum valid alignment score based on a desired match percentage. The results are cached, as the
+    same scores and lengths repeat for every sequence.
 
-    :param aligner: PairwiseAligner object with match/mismatch/gap scores set.
+    :param scores: Tuple of the match, mismatch, open gap, and extend gap scores.
     :param wanted_match_percentage: Desired match percentage (e.g., 0.8 for 80% match).
     :param length: The length of the sequence.
     :return: The minimum valid score for alignment.
     """
-    max_score = aligner.match_score * length
-    avg_penalty = (aligner.mismatch_score + aligner.open_gap_score + aligner.extend_gap_score) / 3
+    match_score, mismatch_score, open_gap_score, extend_gap_score = scores
+    max_score = match_score * length
+    avg_penalty = (mismatch_score + open_gap_score + extend_gap_score) / 3
     penalty_score = avg_penalty * (1 - wanted_match_percentage) * length
     match_score = max_score * wanted_match_percentage
     return match_score + penalty_score
@@ -99,6 +294,7 @@ def percentage_to_min_score(aligner, wanted_match_percentage, length):
 def set_aligner_parameters(scores, mode, wanted_match_percentage, length):
     """
     Configures the pairwise aligner with the provided scoring parameters.
+    The aligners are only read after their configuration, so the same configuration reuses the same aligner.
 
     :param scores: Dictionary of match, mismatch, open gap, and extend gap scores.
     :param mode: Alignment mode ('global' or 'local').
@@ -106,14 +302,27 @@ def set_aligner_parameters(scores, mode, wanted_match_percentage, length):
     :param length: Length of the sequence to align.
     :return: Configured PairwiseAligner object and the minimum valid score.
     """
+    scores_key = (scores['match_score'], scores['mismatch_score'], scores['open_gap_score'],
+                  scores['extend_gap_score'])
+    return cached_aligner_parameters(scores_key, mode, wanted_match_percentage, length)
+
+
+@lru_cache(maxsize=16)
+def cached_aligner_parameters(scores, mode, wanted_match_percentage, length):
+    """
+    Configures the pairwise aligner with the provided scoring parameters, see set_aligner_parameters.
+
+    :param scores: Tuple of the match, mismatch, open gap, and extend gap scores.
+    :param mode: Alignment mode ('global' or 'local').
+    :param wanted_match_percentage: Desired match percentage.
+    :param length: Length of the sequence to align.
+    :return: Configured PairwiseAligner object and the minimum valid score.
+    """
     aligner = PairwiseAligner()
     aligner.mode = mode
-    aligner.match_score = scores['match_score']
-    aligner.mismatch_score = scores['mismatch_score']
-    aligner.open_gap_score = scores['open_gap_score']
-    aligner.extend_gap_score = scores['extend_gap_score']
+    aligner.match_score, aligner.mismatch_score, aligner.open_gap_score, aligner.extend_gap_score = scores
 
-    min_valid_score = percentage_to_min_score(aligner, wanted_match_percentage, length)
+    min_valid_score = scores_to_min_score(scores, wanted_match_percentage, length)
 
     return aligner, min_valid_score
 
@@ -129,29 +338,154 @@ def read_sequences_from_data_set():
     return sequences
 
 
-def get_valid_alignments(aligner, min_valid_score, sequence, primers):
+def select_score_quantization(scores, primer_len):
+    """
+    Picks the narrowest parasail score width (8 or 16 bits) that can hold the best alignment score of the primer with
+    at least MIN_SCORE_QUANTIZATION_SCALE, and the largest scale the width allows.
+
+    :param scores: Dictionary of match, mismatch, open gap, and extend gap scores.
+    :param primer_len: The length of the longest primer.
+    :return: Tuple (width, scale) of the score width in bits and the quantization scale.
+    """
+    for width, max_value in ((8, np.iinfo(np.int8).max), (16, np.iinfo(np.int16).max)):
+        scale = min(MAX_SCORE_QUANTIZATION_SCALE, int(max_value / (scores['match_score'] * primer_len)))
+        # The match score is rounded after scaling, which may push the best score out of range
+        while scale > 1 and round(scores['match_score'] * scale) * primer_len > max_value:
+            scale -= 1
+        if scale >= MIN_SCORE_QUANTIZATION_SCALE:
+            return width, scale
+
+    # Saturated scores are sent to BioPython anyway, so a coarser scale only makes the check less strict
+    return 16, max(1, scale)
+
+
+def quantize_scores(scores, scale):
+    """
+    Scales and rounds the alignment scores to integers, as needed by parasail.
+
+    :param scores: Dictionary of match, mismatch, open gap, and extend gap scores.
+    :param scale: The quantization scale.
+    :return: Dictionary of the integer scores (match_score_int, mismatch_score_int, ...).
+    """
+    return {f"{name}_int": int(round(score * scale)) for name, score in scores.items()}
+
+
+def set_primer_profiles(scores, primers):
+    """
+    Builds the parasail profiles of the primers. The scores are constant within an eval, so the profiles are built
+    once and reused for every read.
+
+    :param scores: Dictionary of match, mismatch, open gap, and extend gap scores.
+    :param primers: The primers as bytes. Could be reverse complement.
+    :return: Dictionary of the front and back primer profiles, the quantized gap penalties, the quantization scale
+             and the matching parasail alignment function.
+    """
+    width, scale = select_score_quantization(scores, max(len(primers['front']), len(primers['back'])))
+    int_scores = quantize_scores(scores, scale)
+    profile_create = parasail.profile_create_8 if width == 8 else parasail.profile_create_16
+
+    # 'N' is part of the alphabet so that it is scored as a mismatch against the primer bases, like in BioPython
+    matrix = parasail.matrix_create("ACGTN", int_scores['match_score_int'], int_scores['mismatch_score_int'])
+
+    # The striped kernel is the fastest for the short primers, but it is only exact when opening a gap costs at least
+    # as much as extending it
+    open_gap, extend_gap = -int_scores['open_gap_score_int'], -int_scores['extend_gap_score_int']
+    if open_gap >= extend_gap:
+        align = parasail.sw_striped_profile_8 if width == 8 else parasail.sw_striped_profile_16
+    else:
+        align = parasail.sw_scan_profile_8 if width == 8 else parasail.sw_scan_profile_16
+
+    primer_profiles = {
+        'front': profile_create(primers['front'], matrix),
+        'back': profile_create(primers['back'], matrix),
+        'open_gap': open_gap,
+        'extend_gap': extend_gap,
+        'scale': scale,
+        'align': align
+    }
+    return primer_profiles
+
+
+def score_reads_parasail(reads, primer_profiles):
+    """
+    Scores the best local alignment of the front and back primers against each read, using parasail's SIMD
+    Smith-Waterman. Both primers are aligned to a read back to back, so the read is still in cache for the second one.
+
+    :param reads: List of DNA sequences.
+    :param primer_profiles: Parasail profiles of the primers, as returned by set_primer_profiles.
+    :return: Dictionaries of the integer alignment scores arrays, and of the boolean arrays of whether each score
+             saturated, for the front and back primers.
+    """
+    read_scores = {'front': np.empty(len(reads), dtype=np.int32), 'back': np.empty(len(reads), dtype=np.int32)}
+    saturated = {'front': np.empty(len(reads), dtype=bool), 'back': np.empty(len(reads), dtype=bool)}
+
+    align = primer_profiles['align']
+    front_profile = primer_profiles['front']
+    back_profile = primer_profiles['back']
+    open_gap = primer_profiles['open_gap']
+    extend_gap = primer_profiles['extend_gap']
+
+    front_scores, back_scores = read_scores['front'], read_scores['back']
+    front_saturated, back_saturated = saturated['front'], saturated['back']
+    for i, read in enumerate(reads):
+        front_result = align(front_profile, read, open_gap, extend_gap)
+        back_result = align(back_profile, read, open_gap, extend_gap)
+        front_scores[i] = front_result.score
+        front_saturated[i] = front_result.saturated
+        back_scores[i] = back_result.score
+        back_saturated[i] = back_result.saturated
+    return read_scores, saturated
+
+
+def batch_align(reads, primer_profiles, min_valid_score, primers):
+    """
+    Checks with parasail, for all the reads of a file at once, whether the best local alignment of each primer could
+    reach the minimum valid score. Rounding every alignment column may shift the quantized score by half a unit, so the
+    check allows for it and only rules out reads that cannot reach the score.
+
+    :param reads: List of DNA sequences.
+    :param primer_profiles: Parasail profiles of the primers, as returned by set_primer_profiles.
+    :param min_valid_score: Minimum score for valid alignments.
+    :param primers: The primers. Could be reverse complement.
+    :return: Dictionary of boolean arrays for the front and back primers, False for the reads that cannot have a
+             valid alignment of the primer.
+    """
+    read_lens = np.fromiter(map(len, reads), dtype=np.int64, count=len(reads))
+    read_scores, saturated = score_reads_parasail(reads, primer_profiles)
+
+    may_align = {}
+    for primer_name in ('front', 'back'):
+        rounding_slack = 0.5 * (read_lens + len(primers[primer_name]))
+        min_read_scores = min_valid_score * primer_profiles['scale'] - rounding_slack
+        may_align[primer_name] = saturated[primer_name] | (read_scores[primer_name] >= min_read_scores)
+    return may_align
+
+
+def get_valid_alignments(aligner, may_align, min_valid_score, sequence, primers):
     """
     Get valid alignments for both front and back primers within a sequence.
+    The BioPython alignments are only computed for primers that passed the parasail score check.
 
     :param aligner: PairwiseAligner object to perform the alignment.
+    :param may_align: Dictionary of the parasail score check results of the sequence for the front and back primers.
     :param min_valid_score: Minimum score for valid alignments.
     :param sequence: The full DNA sequence to search.
     :param primers: The primers. Could be reverse complement.
-    :return: dictionary of valid front and back alignments.
+    :return: dictionary of the positions of the valid front and back alignments. The positions of each primer are a
+             tuple of int32 arrays of the start and end positions of its alignments.
     """
-    valid_alignments_front = []
-    valid_alignments_back = []
-
-    alignments_front = aligner.align(sequence, primers['front'])
-    alignments_back = aligner.align(sequence, primers['back'])
+    no_alignments = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+    valid_alignments = {'front': no_alignments, 'back': no_alignments}
 
-    for f_align in alignments_front:
-        if f_align.score >= min_valid_score:
-            valid_alignments_front.append(f_align)
+    for primer_name in valid_alignments:
+        if not may_align[primer_name]:
+            continue
 
-    for b_align in alignments_back:
-        if b_align.score >= min_valid_score:
-            valid_alignments_back.append(b_align)
+        # All the alignments returned by the aligner share the optimal score
+        alignments = aligner.align(sequence, primers[primer_name])
+        if alignments.score >= min_valid_score:
+            positions = np.array([get_alignment_positions(alignment) for alignment in alignments],
+                                 dtype=np.int32).reshape(-1, 2)
+            valid_alignments[primer_name] = (positions[:, 0], positions[:, 1])
 
-    valid_alignments = {'front': valid_alignments_front, 'back': valid_alignments_back}
     return valid_alignments
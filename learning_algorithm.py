@@ -1,15 +1,45 @@
 from hyperopt import fmin, tpe, Trials
+import numpy as np
 import os
-from config import DEFAULT_SEARCH_SPACE, EVAL_NUM, DIRECTORIES
-from learning_helper_functions import score_comparison, plot_results, \
-    plot_pie_chart, plot_eval_pie_chart
+from config import DEFAULT_SEARCH_SPACE, EVAL_NUM, DIRECTORIES, PLOT_EVERY_EVAL, SVG_PIE_CHARTS
+from learning_helper_functions import score_comparison, plot_results, plot_pie_chart, plot_eval_pie_chart, \
+    plot_pie_chart_svg, plot_eval_pie_chart_svg, EVAL_DTYPE
 from naive_dna_sequence_filter import naive_filtering_percent_of_dir
 from functools import partial
 
+# Directories that were already created by this process
+_created_dirs = set()
+
 
 # ============================= Helper Functions =============================
 
-def objective(params, naive_percent_filtered, eval_counter):
+def plot_eval_pie_charts(eval_stats, file_stats_list, eval_index):
+    """
+    Plots the pie charts of a single eval: one for each file and one for the whole eval.
+
+    :param eval_stats: Statistics object of the eval
+    :param file_stats_list: List of Statistics objects, one for each file
+    :param eval_index: Index of the eval. Starts its count from 0.
+    """
+    eval_dir = os.path.join(DIRECTORIES["learning_dir"], "eval_plots", f"eval_{eval_index}")
+    if eval_dir not in _created_dirs:
+        os.makedirs(eval_dir, exist_ok=True)
+        _created_dirs.add(eval_dir)
+
+    if SVG_PIE_CHARTS:
+        file_pie_chart, eval_pie_chart = plot_pie_chart_svg, plot_eval_pie_chart_svg
+    else:
+        file_pie_chart, eval_pie_chart = plot_pie_chart, plot_eval_pie_chart
+
+    # Plot individual file statistics pie charts
+    for file_stats in file_stats_list:
+        file_pie_chart(file_stats, eval_dir)
+
+    # Plot overall statistics pie chart for the current eval
+    eval_pie_chart(eval_stats, eval_dir, eval_index)
+
+
+def objective(params, naive_percent_filtered, eval_counter, evals):
     """
     Objective function for the optimization algorithm. Runs the sequence filtering algorithm with the given
     hyperparameters
@@ -17,7 +47,8 @@ def objective(params, naive_percent_filtered, eval_counter):
     :param params: Dictionary of hyperparameters (match_score, mismatch_score, open_gap_score, extend_gap_score)
     :param naive_percent_filtered: Percent of sequences filtered out by the naive algorithm
     :param eval_counter: Counter for the current evaluation eval. Starts its count from 1.
-    :return: Dictionary containing the loss, percent_filtered, and status of the evaluation
+    :param evals: Structured array of the evals (see EVAL_DTYPE). The row of the current eval is filled in.
+    :return: Dictionary containing the loss, percent_filtered, status and statistics of the evaluation
     """
     scores = {
         "match_score": params['match_score'],
@@ -26,40 +57,31 @@ def objective(params, naive_percent_filtered, eval_counter):
         "extend_gap_score": params['extend_gap_score']
     }
 
-    eval_dir = os.path.join(DIRECTORIES["learning_dir"], "eval_plots", f"eval_{eval_counter-1}")
-    os.makedirs(eval_dir, exist_ok=True)
-
     # Filter and get statistics
     from main_sequence_filtering import run_filtering
     eval_stats, file_stats_list = run_filtering(scores=scores)
     eval_stats.loss = score_comparison(naive_percent_filtered, eval_stats)
 
-    # Plot individual file statistics pie charts
-    for i, file_stats in enumerate(file_stats_list):
-        os.makedirs(eval_dir, exist_ok=True)
-        plot_pie_chart(file_stats, eval_dir)
+    if PLOT_EVERY_EVAL:
+        plot_eval_pie_charts(eval_stats, file_stats_list, eval_counter-1)
 
-    # Plot overall statistics pie chart for the current eval
-    plot_eval_pie_chart(eval_stats, eval_dir, eval_counter-1)
+    evals[eval_counter-1] = (scores['match_score'], scores['mismatch_score'], scores['open_gap_score'],
+                             scores['extend_gap_score'], eval_stats.loss, eval_stats.percent_filtered)
 
-    return {'loss': eval_stats.loss, 'percent_filtered': eval_stats.percent_filtered, 'status': 'ok'}
+    return {'loss': eval_stats.loss, 'percent_filtered': eval_stats.percent_filtered, 'status': 'ok',
+            'eval_stats': eval_stats, 'file_stats_list': file_stats_list}
 
 
-def plot_and_generate_results(trials_list, naive_percent_filtered, alg_dir_name):
+def plot_and_generate_results(evals, naive_percent_filtered, alg_dir_name):
     """
-    Plots results from trials and generates pie charts for algorithm analysis.
+    Plots results from the evals and generates pie charts for algorithm analysis.
 
-    :param trials_list: List of trial dictionaries containing parameter values and results
+    :param evals: Structured array of the evals (see EVAL_DTYPE)
     :param naive_percent_filtered: Naive filtering percentage of the input directory
     :param alg_dir_name: Subdirectory for specific algorithm plots
     """
-    class MockTrials:
-        def __init__(self, trials):
-            self.trials = trials
-
-    mock_trials_obj = MockTrials(trials_list)
     output_dir = os.path.join(DIRECTORIES["learning_dir"], alg_dir_name)
-    plot_results(mock_trials_obj, naive_percent_filtered, output_dir=output_dir)
+    plot_results(evals, naive_percent_filtered, output_dir=output_dir)
 
 
 # ============================= Optimization Algorithm Functions =============================
@@ -77,20 +99,26 @@ def run_tpe(naive_percent_filtered):
     print("="*64 + "\n")
 
     # Optimize using TPE
-    def objective_with_args(params, naive_percent_filtered):
+    def objective_with_args(params, naive_percent_filtered, evals):
         eval_counter = len(trials.trials)
-        return objective(params, naive_percent_filtered, eval_counter)
+        return objective(params, naive_percent_filtered, eval_counter, evals)
 
-    objective_partial = partial(objective_with_args, naive_percent_filtered=naive_percent_filtered)
+    evals = np.empty(EVAL_NUM, dtype=EVAL_DTYPE)
+    objective_partial = partial(objective_with_args, naive_percent_filtered=naive_percent_filtered, evals=evals)
 
     trials = Trials()
     best = fmin(fn=objective_partial, space=DEFAULT_SEARCH_SPACE, algo=tpe.suggest, max_evals=EVAL_NUM, trials=trials)
+    evals = evals[:len(trials.trials)]
 
     # Plot and generate charts
-    plot_and_generate_results(trials.trials, naive_percent_filtered, "tpe_plots")
-
-    # Extract the best score from the trials
-    best_score = min(trial['result']['loss'] for trial in trials.trials)
+    plot_and_generate_results(evals, naive_percent_filtered, "tpe_plots")
+    if not PLOT_EVERY_EVAL:
+        best_trial = trials.best_trial
+        plot_eval_pie_charts(best_trial['result']['eval_stats'], best_trial['result']['file_stats_list'],
+                             best_trial['tid'])
+
+    # Extract the best score from the evals
+    best_score = float(evals['loss'].min())
     return best, best_score
 
 
@@ -1,3 +1,5 @@
+import math
+from xml.sax.saxutils import escape
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -5,60 +7,61 @@ from config import DIRECTORIES
 import pandas as pd
 
 
+# One row per eval, with the hyperparameters and the results of the eval
+EVAL_DTYPE = [
+    ('match_score', 'f8'),
+    ('mismatch_score', 'f8'),
+    ('open_gap_score', 'f8'),
+    ('extend_gap_score', 'f8'),
+    ('loss', 'f8'),
+    ('percent_filtered', 'f8')
+]
+
+
+# Pie chart sections, in the order of calculate_pie_sizes
+PIE_LABELS = ['Filtered Out', 'Classified as Correct', 'Classified as Incorrect']
+PIE_COLORS = ['gold', 'skyblue', 'lightcoral']
+
+# SVG pie chart templates. The pie is centered at (PIE_CENTER, PIE_CENTER) with a radius of PIE_RADIUS
+PIE_CENTER = 300
+PIE_RADIUS = 200
+SVG_PIE_CHART_TEMPLATE = """<svg xmlns="http://www.w3.org/2000/svg" width="900" height="640" font-family="sans-serif">
+<rect width="100%" height="100%" fill="white"/>
+<text x="450" y="40" text-anchor="middle" font-size="24">{title}</text>
+{subtitle}{wedges}
+{legend}
+</svg>
+"""
+SVG_SUBTITLE_TEMPLATE = '<text x="450" y="610" text-anchor="middle" font-size="16">{subtitle}</text>\n'
+SVG_WEDGE_TEMPLATE = ('<path d="M {cx},{cy} L {x1:.2f},{y1:.2f} A {r},{r} 0 {large_arc},0 {x2:.2f},{y2:.2f} Z" '
+                      'fill="{color}"/>')
+SVG_FULL_WEDGE_TEMPLATE = '<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}"/>'
+SVG_PERCENT_TEMPLATE = '<text x="{x:.2f}" y="{y:.2f}" text-anchor="middle" font-size="16">{size:.1f}%</text>'
+SVG_LEGEND_TEMPLATE = ('<rect x="560" y="{y}" width="20" height="20" fill="{color}"/>'
+                       '<text x="590" y="{text_y}" font-size="16">{label}</text>')
+
+
 # ============================= Helper Functions =============================
 
-def save_hyperparameter_eval_mapping_to_excel(params, losses):
+def save_hyperparameter_eval_mapping_to_excel(evals):
     """
     Save hyperparameter eval mapping to an Excel file.
 
-    :param params: Hyperparameter values over evals.
-    :param losses: Loss values over evals.
+    :param evals: Structured array of the evals (see EVAL_DTYPE).
     """
-    match_scores, mismatch_scores, open_gap_scores, extend_gap_scores = get_scores_lists(params)
-    formatted_losses = [round(loss, 2) for loss in losses]
-
     eval_data = {
-        'Eval': range(len(match_scores)),
-        'match_score': match_scores,
-        'mismatch_score': mismatch_scores,
-        'open_gap_score': open_gap_scores,
-        'extend_gap_score': extend_gap_scores,
-        'Loss': formatted_losses
+        'Eval': np.arange(len(evals)),
+        'match_score': evals['match_score'],
+        'mismatch_score': evals['mismatch_score'],
+        'open_gap_score': evals['open_gap_score'],
+        'extend_gap_score': evals['extend_gap_score'],
+        'Loss': np.round(evals['loss'], 2)
     }
 
     df = pd.DataFrame(eval_data)
     df.to_excel(os.path.join(DIRECTORIES["learning_dir"], "eval_hyperparameter_mapping.xlsx"), index=False)
 
 
-def get_trials_data(trials):
-    """
-    Extract losses, percent filtered, and parameters from trials.
-
-    :param trials: Trials object containing trial data.
-    :return: Tuple (losses, percent_filtered, params).
-    """
-    losses = [x['result']['loss'] for x in trials.trials]
-    percent_filtered = [x['result']['percent_filtered'] for x in trials.trials]
-    params = [x['misc']['vals'] for x in trials.trials]
-
-    return losses, percent_filtered, params
-
-
-def get_scores_lists(params):
-    """
-    Extract lists of match, mismatch, open gap, and extend gap scores from parameters.
-
-    :param params: Hyperparameter values over evals.
-    :return: Tuple of match_scores, mismatch_scores, open_gap_scores, extend_gap_scores.
-    """
-    match_scores = [p['match_score'][0] for p in params]
-    mismatch_scores = [p['mismatch_score'][0] for p in params]
-    open_gap_scores = [p['open_gap_score'][0] for p in params]
-    extend_gap_scores = [p['extend_gap_score'][0] for p in params]
-
-    return match_scores, mismatch_scores, open_gap_scores, extend_gap_scores
-
-
 def calculate_pie_sizes(filtered_out, correct_classified, incorrect_classified):
     """
     Calculate the sizes for pie chart sections based on classification and filtering results.
@@ -77,6 +80,51 @@ def calculate_pie_sizes(filtered_out, correct_classified, incorrect_classified):
     return [(s / total) * 100 for s in sizes]
 
 
+def write_pie_chart_svg(sizes, title, subtitle, output_file):
+    """
+    Write a pie chart as an SVG file. The sections start at 140 degrees and go counterclockwise, like the matplotlib
+    pie charts.
+
+    :param sizes: List of percentages for the pie chart, as returned by calculate_pie_sizes.
+    :param title: Title of the chart.
+    :param subtitle: Text under the chart, left out when empty.
+    :param output_file: Path of the SVG file.
+    """
+    wedges = []
+    start_angle = 140.0
+    for size, color in zip(sizes, PIE_COLORS):
+        if size <= 0:
+            continue
+        if size >= 100:
+            wedges.append(SVG_FULL_WEDGE_TEMPLATE.format(cx=PIE_CENTER, cy=PIE_CENTER, r=PIE_RADIUS, color=color))
+            mid_angle = math.radians(start_angle + 180)
+            text_radius = 0
+        else:
+            end_angle = start_angle + size * 3.6
+            start, end = math.radians(start_angle), math.radians(end_angle)
+            # The y axis of SVG points down
+            wedges.append(SVG_WEDGE_TEMPLATE.format(cx=PIE_CENTER, cy=PIE_CENTER, r=PIE_RADIUS, color=color,
+                                                    x1=PIE_CENTER + PIE_RADIUS * math.cos(start),
+                                                    y1=PIE_CENTER - PIE_RADIUS * math.sin(start),
+                                                    x2=PIE_CENTER + PIE_RADIUS * math.cos(end),
+                                                    y2=PIE_CENTER - PIE_RADIUS * math.sin(end),
+                                                    large_arc=int(size > 50)))
+            mid_angle = (start + end) / 2
+            text_radius = 0.6 * PIE_RADIUS
+            start_angle = end_angle
+        wedges.append(SVG_PERCENT_TEMPLATE.format(x=PIE_CENTER + text_radius * math.cos(mid_angle),
+                                                  y=PIE_CENTER - text_radius * math.sin(mid_angle), size=size))
+
+    legend = [SVG_LEGEND_TEMPLATE.format(y=260 + 30 * i, text_y=276 + 30 * i, color=color, label=label)
+              for i, (color, label) in enumerate(zip(PIE_COLORS, PIE_LABELS))]
+
+    subtitle = SVG_SUBTITLE_TEMPLATE.format(subtitle=escape(subtitle)) if subtitle else ''
+
+    with open(output_file, 'w') as svg_file:
+        svg_file.write(SVG_PIE_CHART_TEMPLATE.format(title=escape(title), subtitle=subtitle,
+                                                     wedges='\n'.join(wedges), legend='\n'.join(legend)))
+
+
 # ============================= Plot Functions =============================
 
 def plot_parameter_distributions(match_scores, mismatch_scores, open_gap_scores, extend_gap_scores, output_dir):
@@ -166,26 +214,26 @@ def plot_percent_filtered_and_loss_over_evals(max_evals, percent_filtered, naive
 
 # ============================= Useful Functions =============================
 
-def plot_results(trials, naive_percent_filtered, output_dir="plots"):
+def plot_results(evals, naive_percent_filtered, output_dir="plots"):
     """
     Plot results including loss over evals, parameter distributions, and more.
 
-    :param trials: Trials object containing data on each eval.
+    :param evals: Structured array of the evals (see EVAL_DTYPE).
     :param naive_percent_filtered: Percent of sequences filtered by the naive algorithm.
     :param output_dir: Directory to save the plots.
     """
     os.makedirs(output_dir, exist_ok=True)
 
-    losses, percent_filtered, params = get_trials_data(trials)
-    match_scores, mismatch_scores, open_gap_scores, extend_gap_scores = get_scores_lists(params)
-    max_evals = len(losses)
+    max_evals = len(evals)
 
     # Save hyperparameter-eval mapping
-    save_hyperparameter_eval_mapping_to_excel(params, losses)
+    save_hyperparameter_eval_mapping_to_excel(evals)
 
     # Generate plots
-    plot_parameter_distributions(match_scores, mismatch_scores, open_gap_scores, extend_gap_scores, output_dir)
-    plot_percent_filtered_and_loss_over_evals(max_evals, percent_filtered, naive_percent_filtered, losses, output_dir)
+    plot_parameter_distributions(evals['match_score'], evals['mismatch_score'], evals['open_gap_score'],
+                                 evals['extend_gap_score'], output_dir)
+    plot_percent_filtered_and_loss_over_evals(max_evals, evals['percent_filtered'], naive_percent_filtered,
+                                              evals['loss'], output_dir)
 
 
 def plot_pie_chart(stats, output_dir):
@@ -199,11 +247,10 @@ def plot_pie_chart(stats, output_dir):
     sizes = calculate_pie_sizes(stats.filtered_out_count, stats.valid_seq_count, stats.invalid_seq_count)
 
     plt.figure(figsize=(8, 8))
-    wedges, _, autotexts = plt.pie(sizes, autopct='%1.1f%%', startangle=140, colors=['gold', 'skyblue', 'lightcoral'])
+    wedges, _, autotexts = plt.pie(sizes, autopct='%1.1f%%', startangle=140, colors=PIE_COLORS)
     plt.axis('equal')
 
-    labels = ['Filtered Out', 'Classified as Correct', 'Classified as Incorrect']
-    plt.legend(wedges, labels, loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
+    plt.legend(wedges, PIE_LABELS, loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
 
     plt.figtext(0.5, 0.87, "File-Specific Filtering and Classification Distribution", ha="center", fontsize=17)
     plt.figtext(0.5, 0.12, file_name, ha="center", fontsize=12)
@@ -226,11 +273,10 @@ def plot_eval_pie_chart(eval_stats, eval_dir, eval_counter):
     sizes = calculate_pie_sizes(eval_stats.filtered_out_count, eval_stats.valid_seq_count, eval_stats.invalid_seq_count)
 
     plt.figure(figsize=(8, 8))
-    wedges, _, autotexts = plt.pie(sizes, autopct='%1.1f%%', startangle=140, colors=['gold', 'skyblue', 'lightcoral'])
+    wedges, _, autotexts = plt.pie(sizes, autopct='%1.1f%%', startangle=140, colors=PIE_COLORS)
     plt.axis('equal')
 
-    labels = ['Filtered Out', 'Classified as Correct', 'Classified as Incorrect']
-    plt.legend(wedges, labels, loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
+    plt.legend(wedges, PIE_LABELS, loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
 
     plt.figtext(0.5, 0.87, f"Eval {eval_counter} Filtering and Classification Distribution", ha="center", fontsize=17)
 
@@ -241,6 +287,34 @@ def plot_eval_pie_chart(eval_stats, eval_dir, eval_counter):
     plt.close()
 
 
+def plot_pie_chart_svg(stats, output_dir):
+    """
+    Plot a pie chart for file-specific filtering and classification results, as an SVG file.
+
+    :param stats: Stats object containing filtering and classification results.
+    :param output_dir: Directory to save the plot.
+    """
+    file_name = stats.file_name
+    sizes = calculate_pie_sizes(stats.filtered_out_count, stats.valid_seq_count, stats.invalid_seq_count)
+
+    output_file = os.path.join(output_dir, f"file_specific_pie_chart_{file_name}.svg")
+    write_pie_chart_svg(sizes, "File-Specific Filtering and Classification Distribution", file_name, output_file)
+
+
+def plot_eval_pie_chart_svg(eval_stats, eval_dir, eval_counter):
+    """
+    Plot a eval pie chart for filtering and classification results across all files, as an SVG file.
+
+    :param eval_stats: EvalStats object containing filtering and classification results.
+    :param eval_dir: Directory to save the plot.
+    :param eval_counter: Counter for the evaluation number.
+    """
+    sizes = calculate_pie_sizes(eval_stats.filtered_out_count, eval_stats.valid_seq_count, eval_stats.invalid_seq_count)
+
+    output_file = os.path.join(eval_dir, f"eval_{eval_counter}_pie_chart.svg")
+    write_pie_chart_svg(sizes, f"Eval {eval_counter} Filtering and Classification Distribution", "", output_file)
+
+
 # ============================= Utility Functions =============================
 
 def score_comparison(naive_percent_filtered, eval_stats):
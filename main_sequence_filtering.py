@@ -1,12 +1,14 @@
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait
 from time import time
-from Bio.Seq import Seq
-from helper_functions import read_FASTQ_file, set_aligner_parameters
+from helper_functions import (read_FASTQ_file, set_aligner_parameters, set_primer_profiles, batch_align,
+                              open_output_files, close_output_files, concatenate_files)
 from learning_algorithm import run_learning_algorithm
-from search_functions import search_seq_and_write, MatchResult
+from search_functions import search_seq_and_write, MatchResult, PRIMERS_RC_BYTES
 from config import MAX_WORKERS, DIRECTORIES, PRIMERS, INDEX_LEN, DEFAULT_SCORES, MACHINE_LEARNING_MODE, DEBUG_MODE, \
-                    RUNNING_ON_WINDOWS
+                    RUNNING_ON_WINDOWS, PRIMERS_BYTES, SEQUENCE_CHUNK_SIZE
 
 INVALID_FIELD = -1
 
@@ -22,74 +24,173 @@ class Statistics:
         self.file_name = ""
 
 
-def process_file(file_index, fastq_file, aligner, min_valid_score, compare_aligner,
-                 compare_min_valid_score):
+# Alignment parameters of a worker process, built once per worker by init_worker
+_worker_params = {}
+
+
+def load_sequences(input_dir):
     """
-    Process a single FASTQ file, applying sequence filtering and comparing results to naive filtering.
+    Read the sequences of all the FASTQ files in the input directory. This stage doesn't depend on the scores, so the
+    parsed files are reused across evals, and when the worker processes are forked they inherit them, see run_filtering.
 
-    :param file_index: Index of the file being processed.
-    :param fastq_file: Name of the FASTQ file.
-    :param aligner: Aligner for local alignment.
-    :param min_valid_score: Minimum valid score for alignment.
-    :param compare_aligner: Aligner for global alignment comparison.
-    :param compare_min_valid_score: Minimum valid score for comparison.
-    :return: Statistics object for the file.
+    :param input_dir: Path to the input directory containing FASTQ files.
+    :return: Dictionary mapping the index of each FASTQ file to its name, ordered from the largest file to the smallest.
     """
-    print(f"---Processing file #{file_index}: {fastq_file}")
+    entries = [(file_index + 1, entry) for file_index, entry in enumerate(os.scandir(input_dir))
+               if entry.name.endswith(".fastq")]
+    # Processing the largest files first keeps the workers busy until the end (longest processing time scheduling)
+    entries.sort(key=lambda indexed_entry: indexed_entry[1].stat().st_size, reverse=True)
 
-    file_stats = Statistics()
-    file_start_time = time()
+    files = {}
+    for file_index, entry in entries:
+        read_FASTQ_file(entry.path)
+        files[file_index] = entry.name
+    return files
 
-    input_dir = DIRECTORIES['input_dir']
-    output_with_primers_dir = DIRECTORIES['output_with_primers_dir']
-    output_wo_primers_dir = DIRECTORIES['output_wo_primers_dir']
-    debug_dir = DIRECTORIES['debug_dir']
 
-    input_path = os.path.join(input_dir, fastq_file)
+def init_worker(scores):
+    """
+    Initializes a worker process, building the aligners and primer profiles of the eval once for all of its files.
 
+    :param scores: Scores for the alignment.
+    """
+    aligner, min_valid_score = set_aligner_parameters(scores=scores, mode="local",
+                                                      wanted_match_percentage=0.85, length=len(PRIMERS['front']))
+    compare_aligner, compare_min_valid_score = set_aligner_parameters(scores=scores, mode="global",
+                                                                      wanted_match_percentage=0.85, length=INDEX_LEN)
+    _worker_params.update({
+        "aligner": aligner,
+        "min_valid_score": min_valid_score,
+        # The scores of the comparison key the minimum valid scores of the compared sequences, see scores_to_min_score
+        "compare_params": {"aligner": compare_aligner, "min_valid_score": compare_min_valid_score,
+                           "scores": (compare_aligner.match_score, compare_aligner.mismatch_score,
+                                      compare_aligner.open_gap_score, compare_aligner.extend_gap_score)},
+        "primer_profiles": set_primer_profiles(scores, PRIMERS_BYTES),
+        "primer_profiles_rc": set_primer_profiles(scores, PRIMERS_RC_BYTES),
+    })
+
+
+def get_output_paths(fastq_file):
+    """
+    Get the paths of the output files of a FASTQ file.
+
+    :param fastq_file: Name of the FASTQ file.
+    :return: Dictionary of the paths of the output files without and with primers and of the debug file.
+    """
     base_filename = os.path.splitext(fastq_file)[0]
-    output_with_primers_file_path = os.path.join(output_with_primers_dir, f"{base_filename}_with_primers.fastq")
-    output_wo_primers_file_path = os.path.join(output_wo_primers_dir, f"{base_filename}_wo_primers.fastq")
-    debug_path = os.path.join(debug_dir, f"{base_filename}_debug.txt")
-    compare_params = {"aligner": compare_aligner, "min_valid_score": compare_min_valid_score}
+    return {
+        "wo_primers": os.path.join(DIRECTORIES['output_wo_primers_dir'], f"{base_filename}_wo_primers.fastq"),
+        "with_primers": os.path.join(DIRECTORIES['output_with_primers_dir'], f"{base_filename}_with_primers.fastq"),
+        "debug": os.path.join(DIRECTORIES['debug_dir'], f"{base_filename}_debug.txt"),
+    }
 
-    sequences_and_scores_dict, seq_count = read_FASTQ_file(input_path)
-    filtered_out_count = 0
 
-    # for learning algorithm
-    valid_seq_count = 0
-    invalid_seq_count = 0
+def get_chunk_path(output_path, chunk_index):
+    """
+    Get the path of the part of an output file written by a single chunk, see process_chunk.
+
+    :param output_path: Path of the output file.
+    :param chunk_index: Index of the chunk in its file.
+    :return: Path of the part file of the chunk.
+    """
+    return f"{output_path}.part{chunk_index}"
+
+
+def process_chunk(file_index, fastq_file, chunk_index, chunk_start, chunk_end, sequences=None):
+    """
+    Process a chunk of the sequences of a FASTQ file, applying sequence filtering.
+    Uses the aligners of the worker process, see init_worker. The outputs of the chunk are written to part files,
+    which are concatenated into the output files of the file by finish_file.
 
-    output_with_primers_file = None
-    output_wo_primers_file = None
+    :param file_index: Index of the file being processed.
+    :param fastq_file: Name of the FASTQ file.
+    :param chunk_index: Index of the chunk in the file.
+    :param chunk_start: Index of the first sequence of the chunk.
+    :param chunk_end: Index after the last sequence of the chunk.
+    :param sequences: The sequences of the chunk, or None to take them from the parsed files the worker process
+                      inherited.
+    :return: Tuple (search_results, execution_time) of a Counter of the search results and the processing time of the
+             chunk.
+    """
+    chunk_start_time = time()
+
+    if sequences is None:
+        sequences = read_FASTQ_file(os.path.join(DIRECTORIES['input_dir'], fastq_file))[0][chunk_start:chunk_end]
+    aligner = _worker_params["aligner"]
+    min_valid_score = _worker_params["min_valid_score"]
+    compare_params = _worker_params["compare_params"]
+    primer_profiles = _worker_params["primer_profiles"]
+    primer_profiles_rc = _worker_params["primer_profiles_rc"]
+
+    output_paths = get_output_paths(fastq_file)
+
+    output_files = None
     debug_file = None
     if not MACHINE_LEARNING_MODE:
-        output_with_primers_file = open(output_with_primers_file_path, "w")
-        output_wo_primers_file = open(output_wo_primers_file_path, "w")
+        output_files = open_output_files(get_chunk_path(output_paths['wo_primers'], chunk_index),
+                                         get_chunk_path(output_paths['with_primers'], chunk_index))
 
     if DEBUG_MODE:
-        debug_file = open(debug_path, "w")
-        debug_file.write(f"-------- Start of file #{file_index} --------\n")
+        debug_file = open(get_chunk_path(output_paths['debug'], chunk_index), "w")
+        if chunk_index == 0:
+            debug_file.write(f"-------- Start of file #{file_index} --------\n")
+
+    # Run the parasail score check of all the sequences at once, before the per sequence search
+    may_align = batch_align(sequences, primer_profiles, min_valid_score, PRIMERS_BYTES)
+    may_align_rc = batch_align(sequences, primer_profiles_rc, min_valid_score, PRIMERS_RC_BYTES)
+
+    # Tally the search results, the counts are read per result type by finish_file
+    search_results = Counter()
+    for i, sequence in enumerate(sequences):
+        seq_may_align = {'front': may_align['front'][i], 'back': may_align['back'][i]}
+        seq_may_align_rc = {'front': may_align_rc['front'][i], 'back': may_align_rc['back'][i]}
+        search_results[search_seq_and_write(aligner, seq_may_align, seq_may_align_rc, min_valid_score,
+                                            compare_params, sequence, output_files, debug_file)] += 1
 
-    for seq_input in sequences_and_scores_dict.keys():
-        sequence = Seq(seq_input)
-        output_files = {"wo_primers": output_wo_primers_file, "with_primers": output_with_primers_file}
+    if DEBUG_MODE:
+        debug_file.close()
 
-        search_res = search_seq_and_write(aligner, min_valid_score, compare_params, sequence, output_files, debug_file)
-        if search_res == MatchResult.FOUND_VALID_MATCH:
-            valid_seq_count += 1
-        elif search_res == MatchResult.FOUND_INVALID_MATCH:
-            invalid_seq_count += 1
-        else:
-            filtered_out_count += 1
+    if not MACHINE_LEARNING_MODE:
+        close_output_files(output_files)
+
+    return search_results, time() - chunk_start_time
+
+
+def finish_file(file_index, fastq_file, chunk_count, search_results, execution_time):
+    """
+    Finish processing a FASTQ file once all of its chunks were processed, concatenating the part files of the chunks
+    into the output files of the file.
+
+    :param file_index: Index of the file being processed.
+    :param fastq_file: Name of the FASTQ file.
+    :param chunk_count: Number of chunks the file was split into.
+    :param search_results: Counter of the search results of all the chunks of the file.
+    :param execution_time: Total processing time of the chunks of the file.
+    :return: Statistics object for the file.
+    """
+    file_stats = Statistics()
+    output_paths = get_output_paths(fastq_file)
+
+    seq_count = sum(search_results.values())
+    filtered_out_count = search_results[MatchResult.NO_MATCH_FOUND]
 
-    execution_time = time() - file_start_time
+    # for learning algorithm
+    valid_seq_count = search_results[MatchResult.FOUND_VALID_MATCH]
+    invalid_seq_count = search_results[MatchResult.FOUND_INVALID_MATCH]
+
+    if not MACHINE_LEARNING_MODE:
+        for name in ('wo_primers', 'with_primers'):
+            concatenate_files([get_chunk_path(output_paths[name], chunk_index) for chunk_index in range(chunk_count)],
+                              output_paths[name])
 
     if DEBUG_MODE:
-        debug_file.write(f"Filtered out (we want it to be small){filtered_out_count} out of {seq_count} sequences\n")
-        debug_file.write(f"Execution time: {execution_time: .2f} sec\n")
-        debug_file.write(f"-------- End of file number {file_index}--------\n")
-        debug_file.close()
+        concatenate_files([get_chunk_path(output_paths['debug'], chunk_index) for chunk_index in range(chunk_count)],
+                          output_paths['debug'])
+        with open(output_paths['debug'], "a") as debug_file:
+            debug_file.write(f"Filtered out (we want it to be small){filtered_out_count} out of {seq_count} "
+                             f"sequences\n")
+            debug_file.write(f"Execution time: {execution_time: .2f} sec\n")
+            debug_file.write(f"-------- End of file number {file_index}--------\n")
 
     print(f"----Finished processing file #{file_index}, Execution time: {execution_time: .2f} sec.\n"
           f"    Filtered total: {filtered_out_count} out of {seq_count} sequences")
@@ -99,19 +200,40 @@ def process_file(file_index, fastq_file, aligner, min_valid_score, compare_align
         file_stats.filtered_out_count = filtered_out_count
         file_stats.valid_seq_count = valid_seq_count
         file_stats.invalid_seq_count = invalid_seq_count
-        file_stats.file_name = base_filename
+        file_stats.file_name = os.path.splitext(fastq_file)[0]
         if seq_count != 0:
             file_stats.percent_filtered = (filtered_out_count/seq_count)*100
-    else:
-        output_with_primers_file.close()
-        output_wo_primers_file.close()
 
     return file_stats
 
 
+def remove_file_outputs(fastq_file, chunk_count):
+    """
+    Remove the output files of a FASTQ file that failed processing, along with the part files of its chunks, so no
+    partial or stale output is left for it.
+
+    :param fastq_file: Name of the FASTQ file.
+    :param chunk_count: Number of chunks the file was split into.
+    """
+    output_paths = get_output_paths(fastq_file)
+    names = []
+    if not MACHINE_LEARNING_MODE:
+        names += ['wo_primers', 'with_primers']
+    if DEBUG_MODE:
+        names.append('debug')
+
+    for name in names:
+        paths = [get_chunk_path(output_paths[name], chunk_index) for chunk_index in range(chunk_count)]
+        for path in paths + [output_paths[name]]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
 def run_filtering(scores=DEFAULT_SCORES):
     """
     Run the filtering process with given parameters across multiple files using parallel processing.
+    The sequences of the files are split into chunks of SEQUENCE_CHUNK_SIZE sequences, so the work is balanced between
+    the worker processes regardless of the sizes of the files.
 
     :param scores: Scores for the alignment.
     :return: eval_stats, file_stats_list - Statistics for the evaluation and for each file.
@@ -119,36 +241,57 @@ def run_filtering(scores=DEFAULT_SCORES):
     start_time = time()
 
     input_dir = DIRECTORIES['input_dir']
-    aligner, min_valid_score = set_aligner_parameters(scores=scores, mode="local",
-                                                      wanted_match_percentage=0.85, length=len(PRIMERS['front']))
-    compare_aligner, compare_min_valid_score = set_aligner_parameters(scores=scores, mode="global",
-                                                                      wanted_match_percentage=0.85, length=INDEX_LEN)
 
     eval_stats = Statistics()
     file_stats_list = []
 
+    files = load_sequences(input_dir)
+
+    # Forked workers inherit the files parsed by load_sequences. Otherwise (e.g. spawn, the default on Windows and
+    # macOS) the sequences of each chunk are sent with its task, so a worker never parses a whole file for one chunk
+    inherit_sequences = multiprocessing.get_start_method() == "fork"
+
     # find the sequences in the files
     print(f"--Starting to iterate over all files in {input_dir}")
-    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [
-            executor.submit(process_file, file_index + 1, fastq_file, aligner, min_valid_score, compare_aligner,
-                            compare_min_valid_score)
-            for file_index, fastq_file in enumerate(os.listdir(input_dir)) if fastq_file.endswith(".fastq")
-        ]
-
-        if MACHINE_LEARNING_MODE:
-            for future in as_completed(futures):
-                try:
-                    file_stats = future.result()
-                    file_stats_list.append(file_stats)
-                    eval_stats.seq_count += file_stats.seq_count
-                    eval_stats.filtered_out_count += file_stats.filtered_out_count
-                    eval_stats.valid_seq_count += file_stats.valid_seq_count
-                    eval_stats.invalid_seq_count += file_stats.invalid_seq_count
-                    if eval_stats.seq_count != 0:  # if it is 0, it indicates an error
-                        eval_stats.percent_filtered = (eval_stats.filtered_out_count / eval_stats.seq_count) * 100
-                except Exception as exc:
-                    print(f"---Error processing file: {exc}")
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_worker, initargs=(scores,)) as executor:
+        file_futures = {}
+        for file_index, fastq_file in files.items():
+            print(f"---Processing file #{file_index}: {fastq_file}")
+            sequences = read_FASTQ_file(os.path.join(input_dir, fastq_file))[0]
+            # An empty file still gets a single chunk, so its output files are created
+            file_futures[file_index] = [
+                executor.submit(process_chunk, file_index, fastq_file, chunk_index, chunk_start,
+                                chunk_start + SEQUENCE_CHUNK_SIZE,
+                                None if inherit_sequences else sequences[chunk_start:chunk_start + SEQUENCE_CHUNK_SIZE])
+                for chunk_index, chunk_start in enumerate(range(0, max(len(sequences), 1), SEQUENCE_CHUNK_SIZE))
+            ]
+
+        # Reduce the results of the chunks in the order of the file indices, so the file statistics keep the order of
+        # the files
+        for file_index, futures in sorted(file_futures.items()):
+            search_results = Counter()
+            execution_time = 0.0
+            try:
+                for future in futures:
+                    chunk_search_results, chunk_execution_time = future.result()
+                    search_results.update(chunk_search_results)
+                    execution_time += chunk_execution_time
+            except Exception as exc:
+                print(f"---Error processing file: {exc}")
+                # Let the other chunks of the file finish, so none of them writes a part file after the cleanup
+                wait(futures)
+                remove_file_outputs(files[file_index], len(futures))
+                continue
+
+            file_stats = finish_file(file_index, files[file_index], len(futures), search_results, execution_time)
+            if MACHINE_LEARNING_MODE:
+                file_stats_list.append(file_stats)
+                eval_stats.seq_count += file_stats.seq_count
+                eval_stats.filtered_out_count += file_stats.filtered_out_count
+                eval_stats.valid_seq_count += file_stats.valid_seq_count
+                eval_stats.invalid_seq_count += file_stats.invalid_seq_count
+                if eval_stats.seq_count != 0:  # if it is 0, it indicates an error
+                    eval_stats.percent_filtered = (eval_stats.filtered_out_count / eval_stats.seq_count) * 100
 
     print("-----Finished iterating over all files")
     print(f"-----Total execution time: {time() - start_time: .2f} sec")
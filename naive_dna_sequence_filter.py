@@ -1,3 +1,4 @@
+from functools import lru_cache
 from time import time
 from helper_functions import (read_FASTQ_file, copy_reverse_complement)
 from config import LIB_LENGTH, PRIMERS
@@ -18,19 +19,20 @@ def naive_search_and_write_seq(sequence, front_primer, back_primer):
     front_index = sequence.find(front_primer)
     back_index = sequence.find(back_primer)
 
+    # The length of the sequence without the primers is calculated from the indices, without slicing it out
     if front_index != -1 and back_index != -1:
-        seq_without_primers = sequence[front_index + len(front_primer):back_index]
-        if abs(len(seq_without_primers) - LIB_LENGTH) <= 5:
+        seq_without_primers_len = max(0, back_index - front_index - len(front_primer))
+        if abs(seq_without_primers_len - LIB_LENGTH) <= 5:
             return True
 
     elif front_index != -1:
-        seq_without_primers = sequence[front_index + len(front_primer):min(len(sequence), front_index + len(front_primer) + LIB_LENGTH)]
-        if abs(len(seq_without_primers) - LIB_LENGTH) <= 5:
+        seq_without_primers_len = min(len(sequence) - front_index - len(front_primer), LIB_LENGTH)
+        if abs(seq_without_primers_len - LIB_LENGTH) <= 5:
             return True
 
     elif back_index != -1:
-        seq_without_primers = sequence[max(0, back_index - LIB_LENGTH):back_index]
-        if abs(len(seq_without_primers) - LIB_LENGTH) <= 5:
+        seq_without_primers_len = min(back_index, LIB_LENGTH)
+        if abs(seq_without_primers_len - LIB_LENGTH) <= 5:
             return True
 
     return False
@@ -46,7 +48,7 @@ def naive_filtering_of_file(input_file_name, primers):
     :param primers: Dictionary containing the front and back primers.
     :return: Tuple containing the number of filtered sequences and the total number of sequences.
     """
-    sequences = read_FASTQ_file(input_file_name)[0].keys()
+    sequences = read_FASTQ_file(input_file_name)[0]
     start_time = time()
     count_filtered = 0
 
@@ -55,6 +57,8 @@ def naive_filtering_of_file(input_file_name, primers):
     front_primer_rc = primers['front_rc']
     back_primer_rc = primers['back_rc']
 
+    # A few str.find calls per sequence are faster than a single multi-pattern (Aho-Corasick) pass over it, since the
+    # matches of such a pass are iterated in Python. The reverse complement primers are only searched when needed
     for sequence in sequences:
         if not naive_search_and_write_seq(sequence, front_primer, back_primer):
             if not naive_search_and_write_seq(sequence, front_primer_rc, back_primer_rc):
@@ -67,9 +71,11 @@ def naive_filtering_of_file(input_file_name, primers):
     return count_filtered, len(sequences)
 
 
+@lru_cache(maxsize=None)
 def naive_filtering_percent_of_dir(input_dir):
     """
     Perform naive filtering on all FASTQ files in a directory and calculate the percentage of filtered sequences.
+    The result is cached, as it doesn't depend on the learned scores.
 
     :param input_dir: Path to the input directory containing FASTQ files.
     :return: Percentage of naively filtered sequences.
@@ -78,10 +84,10 @@ def naive_filtering_percent_of_dir(input_dir):
     total_sequences = 0
 
     primers = {
-        'front': str(PRIMERS['front']),
-        'back': str(PRIMERS['back']),
-        'front_rc': str(copy_reverse_complement(PRIMERS['back'])),
-        'back_rc': str(copy_reverse_complement(PRIMERS['front']))
+        'front': PRIMERS['front'],
+        'back': PRIMERS['back'],
+        'front_rc': copy_reverse_complement(PRIMERS['back']),
+        'back_rc': copy_reverse_complement(PRIMERS['front'])
     }
 
     for file in os.listdir(input_dir):
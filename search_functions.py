@@ -1,8 +1,29 @@
-from helper_functions import (get_alignment_positions, read_sequences_from_data_set, percentage_to_min_score,
-                              copy_reverse_complement, get_valid_alignments)
-from Bio.Seq import Seq
+import numpy as np
+from helper_functions import (read_sequences_from_data_set, scores_to_min_score,
+                              copy_reverse_complement, copy_reverse_complement_bytes,
+                              copy_reverse_complement_with_primers, get_valid_alignments,
+                              write_output_sequences)
+import math
 from enum import Enum, auto
-from config import INDEX_LEN, LIB_LENGTH, PRIMERS, MACHINE_LEARNING_MODE, DEBUG_MODE
+from functools import lru_cache
+from config import (INDEX_LEN, LIB_LENGTH, PRIMERS, PRIMERS_BYTES, MACHINE_LEARNING_MODE, DEBUG_MODE,
+                    DATA_SET_MIN_KMER_LEN)
+
+# Reverse complement the primers
+PRIMERS_RC = {
+    'front': copy_reverse_complement(PRIMERS['back']),
+    'back': copy_reverse_complement(PRIMERS['front']),
+}
+PRIMERS_RC_BYTES = {
+    'front': copy_reverse_complement_bytes(PRIMERS_BYTES['back']),
+    'back': copy_reverse_complement_bytes(PRIMERS_BYTES['front']),
+}
+
+# The found sequences are only compared to the dataset in learning and debug modes
+_NEED_VERIFY = MACHINE_LEARNING_MODE or DEBUG_MODE
+
+# Below this number of front and back alignment pairs, the pairs are checked one by one
+PAIRS_BINARY_SEARCH_MIN_COUNT = 64
 
 
 class MatchResult(Enum):
@@ -14,25 +35,138 @@ class MatchResult(Enum):
 # ******************* DataSet *******************
 
 
-def compare_seq_to_dataset(compare_params, sequence, debug_file):
+@lru_cache(maxsize=1)
+def load_data_set():
+    """
+    Reads the dataset once per process, leaving out its empty lines.
+
+    :return: Tuple of the dataset sequences and a tuple of their indices (the first INDEX_LEN bases of each).
+    """
+    data_set_sequences = tuple(data_set_seq for data_set_seq in read_sequences_from_data_set() if data_set_seq)
+    data_set_indices = tuple(data_set_seq[:INDEX_LEN] for data_set_seq in data_set_sequences)
+    return data_set_sequences, data_set_indices
+
+
+@lru_cache(maxsize=16)
+def data_set_kmer_len(scores, min_valid_score):
+    """
+    Picks the k-mer length of the dataset prefilter. An index alignment that reaches min_valid_score has at most
+    max_edits edits (mismatched and gapped bases), as each edit costs at least edit_cost out of INDEX_LEN * match_score.
+    Splitting a dataset index into max_edits + 1 blocks, at least one block has no edits and appears unchanged in the
+    sequence index, so only the indices sharing a k-mer of the block length with the sequence index can be valid.
+
+    :param scores: Tuple of the match, mismatch, open gap, and extend gap scores.
+    :param min_valid_score: Minimum valid score of the index alignment.
+    :return: The k-mer length, or 0 when the prefilter is not selective enough (shorter than DATA_SET_MIN_KMER_LEN).
+    """
+    match_score, mismatch_score, open_gap_score, extend_gap_score = scores
+    # A mismatch loses a match, a gapped base loses half a match (its opposite base is gapped too) and scores a gap
+    edit_cost = min(match_score - mismatch_score, match_score / 2 - max(open_gap_score, extend_gap_score))
+    if edit_cost <= 0:
+        return 0
+
+    max_edits = max(0, math.floor((INDEX_LEN * match_score - min_valid_score) / edit_cost + 1e-9))
+    kmer_len = INDEX_LEN // (max_edits + 1)
+    return kmer_len if kmer_len >= DATA_SET_MIN_KMER_LEN else 0
+
+
+@lru_cache(maxsize=4)
+def data_set_kmer_index(kmer_len):
+    """
+    Maps the k-mers of the dataset indices to the indices containing them.
+
+    :param kmer_len: The k-mer length.
+    :return: Tuple of the dictionary from each k-mer to the positions of the dataset indices containing it, and the
+             positions of the indices shorter than INDEX_LEN, which the prefilter does not apply to.
+    """
+    kmer_index = {}
+    short_positions = []
+    for position, data_set_seq_index in enumerate(load_data_set()[1]):
+        if len(data_set_seq_index) < INDEX_LEN:
+            short_positions.append(position)
+            continue
+        for kmer in {data_set_seq_index[i:i + kmer_len] for i in range(INDEX_LEN - kmer_len + 1)}:
+            kmer_index.setdefault(kmer, []).append(position)
+    return kmer_index, tuple(short_positions)
+
+
+def data_set_candidates(compare_params, sequence_index):
+    """
+    Finds the dataset indices that might have a valid alignment with the sequence index (see data_set_kmer_len).
+
+    :param compare_params: Dictionary containing compare_aligner, compare_min_valid_score and the compare scores.
+    :param sequence_index: The first INDEX_LEN bases of the sequence.
+    :return: The positions of the candidates in the dataset, in the dataset order.
+    """
+    kmer_len = data_set_kmer_len(compare_params['scores'], compare_params['min_valid_score'])
+    if kmer_len == 0 or len(sequence_index) != INDEX_LEN:
+        return range(len(load_data_set()[0]))
+
+    kmer_index, short_positions = data_set_kmer_index(kmer_len)
+    candidates = set(short_positions)
+    for i in range(INDEX_LEN - kmer_len + 1):
+        candidates.update(kmer_index.get(sequence_index[i:i + kmer_len], ()))
+    return sorted(candidates)
+
+
+@lru_cache(maxsize=1 << 16)
+def valid_index_positions(aligner, min_valid_score, scores, sequence_index):
+    """
+    Finds the dataset indices that have a valid alignment with a sequence index. Reads often share their index, so the
+    results are cached. The aligners are keyed by identity, which stays unique as the cache holds on to them.
+
+    :param aligner: PairwiseAligner object of the dataset comparison.
+    :param min_valid_score: Minimum valid score of the index alignment.
+    :param scores: Tuple of the match, mismatch, open gap, and extend gap scores of the aligner.
+    :param sequence_index: The first INDEX_LEN bases of the sequence.
+    :return: Tuple of the positions of the valid indices in the dataset, in the dataset order.
+    """
+    data_set_indices = load_data_set()[1]
+    compare_params = {'aligner': aligner, 'min_valid_score': min_valid_score, 'scores': scores}
+
+    # An identical index always has a valid score
+    return tuple(position for position in data_set_candidates(compare_params, sequence_index)
+                 if data_set_indices[position] == sequence_index or
+                 aligner.score(sequence_index, data_set_indices[position]) >= min_valid_score)
+
+
+def compare_seq_to_dataset_fast(compare_params, sequence, debug_file):
     """
     Compare a given sequence to a dataset and find the closest match using the provided aligner.
+    Only the full sequence alignments depend on more than the sequence index, so the valid indices are cached.
 
-    :param compare_params: Dictionary containing compare_aligner and compare_min_valid_score.
+    :param compare_params: Dictionary containing compare_aligner, compare_min_valid_score and the compare scores.
     :param sequence: Sequence to compare against the dataset.
-    :param debug_file: File object to write debug information.
+    :param debug_file: Not used, see compare_seq_to_dataset_debug.
     :return: MatchResult indicating whether a valid sequence is found that meets the minimum alignment score.
     """
-    data_set_sequences = read_sequences_from_data_set()
-    min_valid_score = percentage_to_min_score(compare_params['aligner'], 0.85, len(sequence))
+    data_set_sequences = load_data_set()[0]
+    min_valid_score = scores_to_min_score(compare_params['scores'], 0.85, len(sequence))
     sequence_index = sequence[:INDEX_LEN]  # Take the first 12 bases of the sequence
 
-    for data_set_seq in data_set_sequences:
-        if len(data_set_seq) == 0:
-            continue
+    for position in valid_index_positions(compare_params['aligner'], compare_params['min_valid_score'],
+                                          compare_params['scores'], sequence_index):
+        if min_valid_score <= compare_params['aligner'].score(sequence, data_set_sequences[position]):
+            return MatchResult.FOUND_VALID_MATCH
+    return MatchResult.FOUND_INVALID_MATCH
+
 
-        data_set_seq_index_as_string = data_set_seq[:INDEX_LEN]
-        data_set_seq_index = Seq(data_set_seq_index_as_string)
+def compare_seq_to_dataset_debug(compare_params, sequence, debug_file):
+    """
+    Compare a given sequence to a dataset and find the closest match using the provided aligner, writing the
+    alignments of the valid indices and of the matching sequence to the debug file.
+
+    :param compare_params: Dictionary containing compare_aligner, compare_min_valid_score and the compare scores.
+    :param sequence: Sequence to compare against the dataset.
+    :param debug_file: File object to write debug information.
+    :return: MatchResult indicating whether a valid sequence is found that meets the minimum alignment score.
+    """
+    data_set_sequences, data_set_indices = load_data_set()
+    min_valid_score = scores_to_min_score(compare_params['scores'], 0.85, len(sequence))
+    sequence_index = sequence[:INDEX_LEN]  # Take the first 12 bases of the sequence
+
+    for position in data_set_candidates(compare_params, sequence_index):
+        data_set_seq, data_set_seq_index = data_set_sequences[position], data_set_indices[position]
 
         # Align the sequence index with the dataset sequence index
         alignment_idx = compare_params['aligner'].align(sequence_index, data_set_seq_index)[0]
@@ -40,39 +174,72 @@ def compare_seq_to_dataset(compare_params, sequence, debug_file):
         if alignment_idx.score >= compare_params['min_valid_score']:
             alignment_seq = compare_params['aligner'].align(sequence, data_set_seq)[0]
 
-            if DEBUG_MODE:
-                # Streamlined debug prints for consistency
-                debug_msg = (
-                    f"Index: {data_set_seq_index}\n"
-                    f"Index alignment score: {alignment_idx.score}, minimum valid score is {compare_params['min_valid_score']}\n"
-                    f"Best index alignment:\n{alignment_idx}\n"
-                    "------------------\n"
-                )
-                debug_file.write(debug_msg)
+            # Streamlined debug prints for consistency
+            debug_msg = (
+                f"Index: {data_set_seq_index}\n"
+                f"Index alignment score: {alignment_idx.score}, minimum valid score is {compare_params['min_valid_score']}\n"
+                f"Best index alignment:\n{alignment_idx}\n"
+                "------------------\n"
+            )
+            debug_file.write(debug_msg)
 
             if min_valid_score <= alignment_seq.score:
-                if DEBUG_MODE:
-                    debug_full_msg = (
-                        "---------Full sequence details:---------\n"
-                        f"The current sequence (full): {sequence}\n"
-                        f"Matching sequence out of DB (full): {data_set_seq}\n"
-                        f"Sequence alignment score (full): {alignment_seq.score}, minimum valid score is {min_valid_score}\n"
-                        f"Alignment:\n{alignment_seq}\n"
-                        "\n" + "="*64 + "\n\n"
-                    )
-                    debug_file.write(debug_full_msg)
+                debug_full_msg = (
+                    "---------Full sequence details:---------\n"
+                    f"The current sequence (full): {sequence}\n"
+                    f"Matching sequence out of DB (full): {data_set_seq}\n"
+                    f"Sequence alignment score (full): {alignment_seq.score}, minimum valid score is {min_valid_score}\n"
+                    f"Alignment:\n{alignment_seq}\n"
+                    "\n" + "="*64 + "\n\n"
+                )
+                debug_file.write(debug_full_msg)
                 return MatchResult.FOUND_VALID_MATCH
 
-    if DEBUG_MODE:
-        debug_file.write(
-            "!!!!!!!!!!!!!! No valid sequence found !!!!!!!!\n"
-            "\n" + "="*64 + "\n\n"
-        )
+    debug_file.write(
+        "!!!!!!!!!!!!!! No valid sequence found !!!!!!!!\n"
+        "\n" + "="*64 + "\n\n"
+    )
     return MatchResult.FOUND_INVALID_MATCH
 
+
+# The debug prints are only formatted in debug mode, the variant is picked once
+compare_seq_to_dataset = compare_seq_to_dataset_debug if DEBUG_MODE else compare_seq_to_dataset_fast
+
 # ******************* Both primers *******************
 
 
+def find_valid_primers_pair(front_ends, back_starts):
+    """
+    Finds the first pair of front and back alignments, in the order of the front alignments and then of the back
+    alignments, with a valid distance between them. Few pairs are checked one by one, and otherwise the back
+    alignments are sorted and the window of valid back starts is binary searched for each front alignment.
+
+    :param front_ends: Array of the end positions of the front primer alignments.
+    :param back_starts: Array of the start positions of the back primer alignments.
+    :return: Tuple of the indices of the front and back alignments of the pair, or None if there is no valid pair.
+    """
+    if len(front_ends) * len(back_starts) < PAIRS_BINARY_SEARCH_MIN_COUNT:
+        back_starts_list = back_starts.tolist()
+        for f_index, f_end in enumerate(front_ends.tolist()):
+            for b_index, b_start in enumerate(back_starts_list):
+                if LIB_LENGTH - 5 <= b_start - f_end <= LIB_LENGTH + 5:
+                    return f_index, b_index
+        return None
+
+    back_order = np.argsort(back_starts, kind='stable')
+    sorted_back_starts = back_starts[back_order]
+    window_starts = np.searchsorted(sorted_back_starts, front_ends + (LIB_LENGTH - 5), side='left')
+    window_ends = np.searchsorted(sorted_back_starts, front_ends + (LIB_LENGTH + 5), side='right')
+    valid_fronts = np.flatnonzero(window_starts < window_ends)
+    if len(valid_fronts) == 0:
+        return None
+
+    # The window is sorted by the start positions, the first back alignment in it is the one with the lowest index
+    f_index = int(valid_fronts[0])
+    b_index = int(back_order[window_starts[f_index]:window_ends[f_index]].min())
+    return f_index, b_index
+
+
 def search_both_primers_helper(valid_alignments, sequence, output_files, compare_params, debug_file, is_reversed):
     """
     Search for sequences containing both front and back primers within a valid distance, considering reverse complement
@@ -87,29 +254,31 @@ def search_both_primers_helper(valid_alignments, sequence, output_files, compare
     :return: MatchResult indicating whether a match was found.
     """
 
-    valid_alignments_front, valid_alignments_back = valid_alignments.values()
+    (front_starts, front_ends), (back_starts, back_ends) = valid_alignments.values()
 
-    for f_align in valid_alignments_front:
-        for b_align in valid_alignments_back:
-            f_start, f_end = get_alignment_positions(f_align)
-            b_start, b_end = get_alignment_positions(b_align)
-            distance = b_start - f_end
+    valid_pair = find_valid_primers_pair(front_ends, back_starts)
+    if valid_pair is not None:
+        f_index, b_index = valid_pair
+        f_start, f_end = int(front_starts[f_index]), int(front_ends[f_index])
+        b_start, b_end = int(back_starts[b_index]), int(back_ends[b_index])
 
-            if LIB_LENGTH - 5 <= distance <= LIB_LENGTH + 5:
-                seq_without_primers = sequence[f_end:b_start]
-                seq_with_primers = sequence[f_start:b_end]
+        seq_without_primers = sequence[f_end:b_start]
+        if MACHINE_LEARNING_MODE:
+            # Nothing is written in learning mode, so only the sequence without the primers is needed
+            if is_reversed:
+                seq_without_primers = copy_reverse_complement(seq_without_primers)
+            return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
 
-                if is_reversed:
-                    seq_without_primers = copy_reverse_complement(seq_without_primers)
-                    seq_with_primers = copy_reverse_complement(seq_with_primers)
+        seq_with_primers = sequence[f_start:b_end]
+        if is_reversed:
+            seq_without_primers, seq_with_primers = copy_reverse_complement_with_primers(
+                seq_with_primers, f_end - f_start, b_end - b_start)
 
-                if not MACHINE_LEARNING_MODE:
-                    output_files['wo_primers'].write(str(seq_without_primers) + "\n")
-                    output_files['with_primers'].write(str(seq_with_primers) + "\n")
+        write_output_sequences(output_files, seq_without_primers, seq_with_primers)
 
-                if MACHINE_LEARNING_MODE or DEBUG_MODE:
-                    return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
-                return MatchResult.FOUND_VALID_MATCH
+        if _NEED_VERIFY:
+            return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
+        return MatchResult.FOUND_VALID_MATCH
 
     return MatchResult.NO_MATCH_FOUND
 
@@ -150,7 +319,7 @@ def search_single_front_primer_helper(valid_alignments_front, sequence, output_f
     """
     Search for sequences with a valid front primer match.
 
-    :param valid_alignments_front: List of valid front primer alignments.
+    :param valid_alignments_front: Start and end positions arrays of the valid front primer alignments.
     :param sequence: Full DNA sequence to search.
     :param output_files: Dictionary containing output_wo_primers and output_with_primers file objects.
     :param compare_params: Dictionary containing aligner and min_valid_score for comparison.
@@ -158,27 +327,30 @@ def search_single_front_primer_helper(valid_alignments_front, sequence, output_f
     :param is_reversed: Boolean indicating if the sequence is reverse complemented.
     :return: MatchResult indicating whether a valid match was found.
     """
-    for f_align in valid_alignments_front:
-        f_start, f_end = get_alignment_positions(f_align)
+    front_starts, front_ends = valid_alignments_front
+    for f_start, f_end in zip(front_starts.tolist(), front_ends.tolist()):
         start_pos = f_end
         end_pos = start_pos + LIB_LENGTH
-        seq_with_primers = sequence[f_start:end_pos]
 
         # Skip if out of bounds
         if end_pos >= len(sequence):
             continue
 
         seq_without_primers = sequence[start_pos:end_pos]
+        if MACHINE_LEARNING_MODE:
+            # Nothing is written in learning mode, so only the sequence without the primers is needed
+            if is_reversed:
+                seq_without_primers = copy_reverse_complement(seq_without_primers)
+            return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
 
+        seq_with_primers = sequence[f_start:end_pos]
         if is_reversed:
-            seq_without_primers = copy_reverse_complement(seq_without_primers)
-            seq_with_primers = copy_reverse_complement(seq_with_primers)
+            seq_without_primers, seq_with_primers = copy_reverse_complement_with_primers(
+                seq_with_primers, f_end - f_start, 0)
 
-        if not MACHINE_LEARNING_MODE:
-            output_files['wo_primers'].write(str(seq_without_primers) + "\n")
-            output_files['with_primers'].write(str(seq_with_primers) + "\n")
+        write_output_sequences(output_files, seq_without_primers, seq_with_primers)
 
-        if MACHINE_LEARNING_MODE or DEBUG_MODE:
+        if _NEED_VERIFY:
             return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
         return MatchResult.FOUND_VALID_MATCH
 
@@ -191,7 +363,7 @@ def search_single_back_primer_helper(valid_alignments_back, sequence, output_fil
     """
     Search for sequences with a valid back primer match.
 
-    :param valid_alignments_back: List of valid back primer alignments.
+    :param valid_alignments_back: Start and end positions arrays of the valid back primer alignments.
     :param sequence: Full DNA sequence to search.
     :param output_files: Dictionary containing output_wo_primers and output_with_primers file objects.
     :param compare_params: Dictionary containing aligner and min_valid_score for comparison.
@@ -199,28 +371,31 @@ def search_single_back_primer_helper(valid_alignments_back, sequence, output_fil
     :param is_reversed: Boolean indicating if the sequence is reverse complemented.
     :return: MatchResult indicating whether a valid match was found.
     """
-    for b_align in valid_alignments_back:
-        b_start, b_end = get_alignment_positions(b_align)
+    back_starts, back_ends = valid_alignments_back
+    for b_start, b_end in zip(back_starts.tolist(), back_ends.tolist()):
         end_pos = b_start
         start_pos = end_pos - LIB_LENGTH
-        seq_with_primers = sequence[start_pos:b_end]
 
         # Skip if out of bounds
         if start_pos < 0:
             continue
 
         seq_without_primers = sequence[start_pos:end_pos]
+        if MACHINE_LEARNING_MODE:
+            # Nothing is written in learning mode, so only the sequence without the primers is needed
+            if is_reversed:
+                seq_without_primers = copy_reverse_complement(seq_without_primers)
+            return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
 
+        seq_with_primers = sequence[start_pos:b_end]
         # Apply ternary condition for reversed sequences
         if is_reversed:
-            seq_without_primers = copy_reverse_complement(seq_without_primers)
-            seq_with_primers = copy_reverse_complement(seq_with_primers)
+            seq_without_primers, seq_with_primers = copy_reverse_complement_with_primers(
+                seq_with_primers, 0, b_end - b_start)
 
-        if not MACHINE_LEARNING_MODE:
-            output_files['wo_primers'].write(str(seq_without_primers) + "\n")
-            output_files['with_primers'].write(str(seq_with_primers) + "\n")
+        write_output_sequences(output_files, seq_without_primers, seq_with_primers)
 
-        if MACHINE_LEARNING_MODE or DEBUG_MODE:
+        if _NEED_VERIFY:
             return compare_seq_to_dataset(compare_params, seq_without_primers, debug_file)
         return MatchResult.FOUND_VALID_MATCH
 
@@ -279,28 +454,33 @@ def search_exact_match(sequence, primers, output_files):
     """
     front_primer, back_primer = primers.values()
     f_end = sequence.find(front_primer)
+    # Both primers are needed, so the back primer is only searched for after the front primer was found
+    if f_end == -1:
+        return False
     b_start = sequence.find(back_primer)
+    if b_start == -1:
+        return False
     f_start = f_end - len(front_primer)  # has to be in bounds, because we found exact matches for the primers
     b_end = b_start + len(back_primer)
 
-    if f_end != -1 and b_start != -1:
-        seq_without_primers = sequence[f_end:b_start]
-        if LIB_LENGTH - 5 <= len(seq_without_primers) <= LIB_LENGTH + 5:
-            seq_with_primers = sequence[f_start:b_end]
-            if not MACHINE_LEARNING_MODE:
-                output_files['wo_primers'].write(f"{seq_without_primers}\n")
-                output_files['with_primers'].write(f"{seq_with_primers}\n")
-            return True
+    seq_without_primers = sequence[f_end:b_start]
+    if LIB_LENGTH - 5 <= len(seq_without_primers) <= LIB_LENGTH + 5:
+        if not MACHINE_LEARNING_MODE:
+            write_output_sequences(output_files, seq_without_primers, sequence[f_start:b_end])
+        return True
     return False
 
 # ******************* Main search function *******************
 
 
-def search_seq_and_write(aligner, min_valid_score, compare_params, sequence, output_files, debug_file):
+def search_seq_and_write(aligner, may_align, may_align_rc, min_valid_score, compare_params, sequence, output_files,
+                         debug_file):
     """
     Search for sequences and write the results to the output files.
 
     :param aligner: PairwiseAligner object for alignment.
+    :param may_align: Parasail score check results of the sequence for the primers.
+    :param may_align_rc: Parasail score check results of the sequence for the reverse complement primers.
     :param min_valid_score: Minimum valid alignment score.
     :param compare_params: Dictionary containing aligner and min_valid_score for dataset comparison.
     :param sequence: The full DNA sequence to search.
@@ -308,20 +488,14 @@ def search_seq_and_write(aligner, min_valid_score, compare_params, sequence, out
     :param debug_file: File object for writing debug information.
     :return: MatchResult indicating whether a valid match was found.
     """
-    # Reverse complement the primers
-    PRIMERS_RC = {
-        'front': Seq(copy_reverse_complement(PRIMERS['back'])),
-        'back': Seq(copy_reverse_complement(PRIMERS['front'])),
-    }
-
     # Do an initial exact match search - without using an aligner(and without learning hyperparameters)
     if (search_exact_match(sequence, PRIMERS, output_files) or
             search_exact_match(sequence, PRIMERS_RC, output_files)):
         return MatchResult.FOUND_VALID_MATCH
 
     # Get valid alignments for both regular and reversed primers
-    valid_alignments = get_valid_alignments(aligner, min_valid_score, sequence, PRIMERS)
-    valid_alignments_rc = get_valid_alignments(aligner, min_valid_score, sequence, PRIMERS_RC)
+    valid_alignments = get_valid_alignments(aligner, may_align, min_valid_score, sequence, PRIMERS)
+    valid_alignments_rc = get_valid_alignments(aligner, may_align_rc, min_valid_score, sequence, PRIMERS_RC)
 
     # Search for both primers
     search_res = search_both_primers(valid_alignments, valid_alignments_rc, sequence, output_files,